@@ -71,6 +71,7 @@ Checker object are available. Some examples:
 lines: a list of the raw lines from the input file
 tokens: the tokens that contribute to this logical line
 line_number: line number in the input file
+indent: leading whitespace of the current physical line
 blank_lines: blank lines before this one
 indent_char: first indentation character in this file (' ' or '\t')
 indent_level: indentation (with tabs expanded to multiples of 8)
@@ -88,9 +89,13 @@ import re
 import time
 import inspect
 import tokenize
+import traceback
+from bisect import bisect_right
+from collections import Counter
 from optparse import OptionParser
 from keyword import iskeyword
-from fnmatch import fnmatch
+from operator import attrgetter
+from fnmatch import fnmatch, translate
 
 __version__ = '0.2.0'
 __revision__ = '$Rev$'
@@ -99,6 +104,7 @@ default_exclude = '.svn,CVS,*.pyc,*.pyo'
 
 indent_match = re.compile(r'([ \t]*)').match
 raise_comma_match = re.compile(r'raise\s+\w+\s*(,)').match
+lambda_search = re.compile(r'\blambda\b').search
 
 operators = """
 +  -  *  /  %  ^  &  |  =  <  >  >>  <<
@@ -107,6 +113,21 @@ operators = """
 in is or not and
 """.split()
 
+# Longest first, so that the alternation prefers e.g. '>>=' over '>>'.
+# Keyword operators only match whole words, not 'or' in 'color  = 1'.
+operators_regex = '|'.join([
+    operator.isalpha() and r'\b%s\b' % operator or re.escape(operator)
+    for operator in sorted(operators, key=len, reverse=True)])
+extraneous_open_search = re.compile(r'([[({]) ').search
+extraneous_close_finditer = re.compile(r' ([\]})])').finditer
+extraneous_punctuation_search = re.compile(r' ([,;:])').search
+whitespace_around_operator_search = re.compile(
+    r'(?P<before>  |\t)(?:%s)|(?:%s)(?P<after>  |\t)'
+    % (operators_regex, operators_regex)).search
+whitespace_after_comma_search = re.compile(r'[,;:](  |\t)').search
+# Matches wherever any of the whitespace searches above could match.
+whitespace_suspect_search = re.compile(r'  |\t|[[({] | [\]}),;:]').search
+
 options = None
 args = None
 
@@ -116,7 +137,7 @@ args = None
 ##############################################################################
 
 
-def tabs_or_spaces(physical_line, indent_char):
+def tabs_or_spaces(physical_line, indent, indent_char):
     """
     Never mix tabs and spaces.
 
@@ -127,26 +148,28 @@ def tabs_or_spaces(physical_line, indent_char):
     warnings about code that illegally mixes tabs and spaces.  When using -tt
     these warnings become errors.  These options are highly recommended!
     """
-    indent = indent_match(physical_line).group(1)
-    for offset, char in enumerate(indent):
-        if char != indent_char:
-            return offset, "E101 indentation contains mixed spaces and tabs"
+    mixed = indent.lstrip(indent_char)
+    if mixed:
+        offset = len(indent) - len(mixed)
+        return offset, "E101 indentation contains mixed spaces and tabs"
 
 
-def tabs_obsolete(physical_line):
+def tabs_obsolete(physical_line, indent):
     """
     For new projects, spaces-only are strongly recommended over tabs.  Most
     editors have features that make this easy to do.
     """
-    indent = indent_match(physical_line).group(1)
-    if indent.count('\t'):
-        return indent.index('\t'), "W191 indentation contains tabs"
+    offset = indent.find('\t')
+    if offset > -1:
+        return offset, "W191 indentation contains tabs"
 
 
 def trailing_whitespace(physical_line):
     """
     JCR: Trailing whitespace is superfluous.
     """
+    if physical_line[-1:] == '\n' and not physical_line[-2:-1].isspace():
+        return # Common case, nothing to strip
     physical_line = physical_line.rstrip('\n') # chr(10), newline
     physical_line = physical_line.rstrip('\r') # chr(13), carriage return
     physical_line = physical_line.rstrip('\x0c') # chr(12), form feed, ^L
@@ -182,9 +205,11 @@ def maximum_line_length(physical_line):
     For flowing long blocks of text (docstrings or comments), limiting the
     length to 72 characters is recommended.
     """
-    length = len(physical_line.rstrip())
+    length = len(physical_line)
     if length > 79:
-        return 79, "E501 line too long (%d characters)" % length
+        length = len(physical_line.rstrip())
+        if length > 79:
+            return 79, "E501 line too long (%d characters)" % length
 
 
 ##############################################################################
@@ -229,18 +254,21 @@ def extraneous_whitespace(logical_line):
     - Immediately before a comma, semicolon, or colon.
     """
     line = logical_line
-    for char in '([{':
-        found = line.find(char + ' ')
-        if found > -1:
-            return found + 1, "E201 whitespace after '%s'" % char
-    for char in '}])':
-        found = line.find(' ' + char)
-        if found > -1 and line[found - 1] != ',':
+    match = extraneous_open_search(line)
+    if match:
+        return match.start() + 1, "E201 whitespace after '%s'" % match.group(1)
+    seen = ''
+    for match in extraneous_close_finditer(line):
+        char = match.group(1)
+        if char in seen:
+            continue # Only the first one counts, like the old str.find
+        seen += char
+        found = match.start()
+        if line[found - 1] != ',':
             return found, "E202 whitespace before '%s'" % char
-    for char in ',;:':
-        found = line.find(' ' + char)
-        if found > -1:
-            return found, "E203 whitespace before '%s'" % char
+    match = extraneous_punctuation_search(line)
+    if match:
+        return match.start(), "E203 whitespace before '%s'" % match.group(1)
 
 
 def missing_whitespace(logical_line):
@@ -248,12 +276,17 @@ def missing_whitespace(logical_line):
     JCR: Each comma, semicolon or colon should be followed by whitespace.
     """
     line = logical_line
+    counted = 0 # Square brackets in line[:counted] have been counted
+    brackets = 0 # Open minus closed square brackets in line[:counted]
     for index in range(len(line) - 1):
         char = line[index]
         if char in ',;:' and line[index + 1] != ' ':
-            before = line[:index]
-            if char == ':' and before.count('[') > before.count(']'):
-                continue # Slice syntax, no space required
+            if char == ':':
+                brackets += (line.count('[', counted, index) -
+                             line.count(']', counted, index))
+                counted = index
+                if brackets > 0:
+                    continue # Slice syntax, no space required
             return index, "E231 missing whitespace after '%s'" % char
 
 
@@ -308,20 +341,17 @@ def whitespace_around_operator(logical_line):
     - More than one space around an assignment (or other) operator to
       align it with another.
     """
-    line = logical_line
-    for operator in operators:
-        found = line.find('  ' + operator)
-        if found > -1:
+    match = whitespace_around_operator_search(logical_line)
+    if match:
+        found = match.start()
+        before = match.group('before')
+        if before == '  ':
             return found, "E221 multiple spaces before operator"
-        found = line.find(operator + '  ')
-        if found > -1:
-            return found, "E222 multiple spaces after operator"
-        found = line.find('\t' + operator)
-        if found > -1:
+        if before == '\t':
             return found, "E223 tab before operator"
-        found = line.find(operator + '\t')
-        if found > -1:
-            return found, "E224 tab after operator"
+        if match.group('after') == '  ':
+            return found, "E222 multiple spaces after operator"
+        return found, "E224 tab after operator"
 
 
 def whitespace_around_comma(logical_line):
@@ -334,13 +364,13 @@ def whitespace_around_comma(logical_line):
     JCR: This should also be applied around comma etc.
     """
     line = logical_line
-    for separator in ',;:':
-        found = line.find(separator + '  ')
-        if found > -1:
+    match = whitespace_after_comma_search(line)
+    if match:
+        found = match.start()
+        separator = line[found]
+        if match.group(1) == '  ':
             return found + 1, "E241 multiple spaces after '%s'" % separator
-        found = line.find(separator + '\t')
-        if found > -1:
-            return found + 1, "E242 tab after '%s'" % separator
+        return found + 1, "E242 tab after '%s'" % separator
 
 
 def imports_on_separate_lines(logical_line):
@@ -365,7 +395,7 @@ def compound_statements(logical_line):
         before = line[:found]
         if (before.count('{') <= before.count('}') and # {'a': 1} (dict)
             before.count('[') <= before.count(']') and # [1:2] (slice)
-            not re.search(r'\blambda\b', before)):     # lambda x: x
+            not lambda_search(before)):                # lambda x: x
             return found, "E701 multiple statements on one line (colon)"
     found = line.find(';')
     if -1 < found:
@@ -421,15 +451,7 @@ def expand_indent(line):
     >>> expand_indent('        \\t')
     16
     """
-    result = 0
-    for char in line:
-        if char == '\t':
-            result = result / 8 * 8 + 8
-        elif char == ' ':
-            result += 1
-        else:
-            break
-    return result
+    return len(indent_match(line).group(1).expandtabs(8))
 
 
 ##############################################################################
@@ -447,7 +469,8 @@ def message(text):
 def find_checks(argument_name):
     """
     Find all globally visible functions where the first argument name
-    starts with argument_name.
+    starts with argument_name. The PEP 8 text for --show-pep8 is taken
+    from the docstring and stored as the pep8_doc attribute.
     """
     checks = []
     function_type = type(find_checks)
@@ -455,11 +478,25 @@ def find_checks(argument_name):
         if type(function) is function_type:
             args = inspect.getargspec(function)[0]
             if len(args) >= 1 and args[0].startswith(argument_name):
-                checks.append((name, function, args))
+                doc = function.__doc__ or ''
+                function.pep8_doc = doc.lstrip('\n').rstrip()
+                checks.append((name, function, make_caller(function, args)))
     checks.sort()
     return checks
 
 
+def make_caller(check, argument_names):
+    """
+    Return a function that runs the check plugin on a Checker object,
+    with the requested attributes of the Checker as arguments.
+    """
+    if len(argument_names) == 1:
+        getter = attrgetter(argument_names[0])
+        return lambda checker: check(getter(checker))
+    getter = attrgetter(*argument_names)
+    return lambda checker: check(*getter(checker))
+
+
 def mute_string(text):
     """
     Replace contents with 'xxx' to prevent syntax matching.
@@ -490,13 +527,20 @@ class Checker:
     Load a Python source file, tokenize it, check coding style.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, lines=None):
         self.filename = filename
-        self.lines = file(filename).readlines()
-        self.physical_checks = find_checks('physical_line')
-        self.logical_checks = find_checks('logical_line')
-        options.counters['physical lines'] = \
-            options.counters.get('physical lines', 0) + len(self.lines)
+        if lines is None:
+            source = open(filename, 'rb')
+            try:
+                lines = source.read().splitlines(True)
+            finally:
+                source.close()
+            options.counters['physical lines'] += len(lines)
+        self.lines = lines
+        self.physical_checks = physical_checks
+        self.clean_physical_checks = clean_physical_checks
+        self.logical_checks = logical_checks
+        self.clean_logical_checks = clean_logical_checks
 
     def readline(self):
         """
@@ -517,24 +561,23 @@ class Checker:
             self.check_physical(line)
         return line
 
-    def run_check(self, check, argument_names):
-        """
-        Run a check plugin.
-        """
-        arguments = []
-        for name in argument_names:
-            arguments.append(getattr(self, name))
-        return check(*arguments)
-
     def check_physical(self, line):
         """
         Run all physical checks on a raw input line.
         """
         self.physical_line = line
-        if self.indent_char is None and len(line) and line[0] in ' \t':
+        self.indent = indent = indent_match(line).group(1)
+        if self.indent_char is None and indent:
             self.indent_char = line[0]
-        for name, check, argument_names in self.physical_checks:
-            result = self.run_check(check, argument_names)
+        if (len(line) <= 80 and line[-1:] == '\n' and
+            line[-2:-1].strip() and # Visible character before newline
+            (not indent or (self.indent_char == ' ' and
+                            '\t' not in indent))):
+            checks = self.clean_physical_checks
+        else:
+            checks = self.physical_checks
+        for name, check, caller in checks:
+            result = caller(self)
             if result is not None:
                 offset, text = result
                 self.report_error(self.line_number, offset, text, check)
@@ -544,6 +587,7 @@ class Checker:
         Build a logical line from tokens.
         """
         self.mapping = []
+        self.mapping_offsets = []
         logical = []
         length = 0
         previous = None
@@ -567,6 +611,7 @@ class Checker:
                     logical.append(fill)
                     length += len(fill)
             self.mapping.append((length, token))
+            self.mapping_offsets.append(length)
             logical.append(text)
             length += len(text)
             previous = token
@@ -578,8 +623,7 @@ class Checker:
         """
         Build a line from tokens and run all logical checks on it.
         """
-        options.counters['logical lines'] = \
-            options.counters.get('logical lines', 0) + 1
+        options.counters['logical lines'] += 1
         self.build_tokens_line()
         first_line = self.lines[self.mapping[0][1][2][0] - 1]
         indent = first_line[:self.mapping[0][1][2][1]]
@@ -587,20 +631,23 @@ class Checker:
         self.indent_level = expand_indent(indent)
         if options.verbose >= 2:
             print self.logical_line[:80].rstrip()
-        for name, check, argument_names in self.logical_checks:
+        if whitespace_suspect_search(self.logical_line):
+            checks = self.logical_checks
+        else:
+            checks = self.clean_logical_checks
+        for name, check, caller in checks:
             if options.verbose >= 3:
                 print '   ', name
-            result = self.run_check(check, argument_names)
+            result = caller(self)
             if result is not None:
                 offset, text = result
                 if type(offset) is tuple:
                     original_number, original_offset = offset
                 else:
-                    for token_offset, token in self.mapping:
-                        if offset >= token_offset:
-                            original_number = token[2][0]
-                            original_offset = (token[2][1]
-                                               + offset - token_offset)
+                    index = bisect_right(self.mapping_offsets, offset) - 1
+                    token_offset, token = self.mapping[index]
+                    original_number = token[2][0]
+                    original_offset = token[2][1] + offset - token_offset
                 self.report_error(original_number, original_offset,
                                   text, check)
         self.previous_logical = self.logical_line
@@ -620,19 +667,23 @@ class Checker:
         for token in tokenize.generate_tokens(self.readline_check_physical):
             # print tokenize.tok_name[token[0]], repr(token)
             self.tokens.append(token)
-            token_type, text = token[0:2]
-            if token_type == tokenize.OP and text in '([{':
-                parens += 1
-            if token_type == tokenize.OP and text in '}])':
-                parens -= 1
-            if token_type == tokenize.NEWLINE and not parens:
-                self.check_logical()
-                self.blank_lines = 0
-                self.tokens = []
-            if token_type == tokenize.NL and not parens:
-                self.blank_lines += 1
-                self.tokens = []
-            if token_type == tokenize.COMMENT:
+            token_type = token[0]
+            if token_type == tokenize.OP:
+                text = token[1]
+                if text in '([{':
+                    parens += 1
+                elif text in '}])':
+                    parens -= 1
+            elif token_type == tokenize.NEWLINE:
+                if not parens:
+                    self.check_logical()
+                    self.blank_lines = 0
+                    self.tokens = []
+            elif token_type == tokenize.NL:
+                if not parens:
+                    self.blank_lines += 1
+                    self.tokens = []
+            elif token_type == tokenize.COMMENT:
                 source_line = token[4]
                 token_start = token[2][1]
                 if source_line[:token_start].strip() == '':
@@ -647,7 +698,7 @@ class Checker:
             message(self.filename)
         self.file_errors += 1
         code = text[:4]
-        options.counters[code] = options.counters.get(code, 0) + 1
+        options.counters[code] += 1
         options.messages[code] = text[5:]
         if options.quiet:
             return
@@ -667,19 +718,62 @@ class Checker:
                 message(line.rstrip())
                 message(' ' * offset + '^')
             if options.show_pep8:
-                message(check.__doc__.lstrip('\n').rstrip())
+                message(check.pep8_doc)
+
+    def report_collected(self, errors):
+        """
+        Report errors that were collected by a CollectingChecker.
+        """
+        self.file_errors = 0
+        for line_number, offset, text, name in errors:
+            self.report_error(line_number, offset, text, globals()[name])
+        return self.file_errors
 
 
-def input_file(filename):
+class CollectingChecker(Checker):
     """
-    Run all checks on a Python source file.
+    Run all checks like Checker, but collect the errors instead of
+    reporting them. This is used in worker processes, see input_parallel.
+    """
+
+    def __init__(self, filename, lines=None):
+        Checker.__init__(self, filename, lines)
+        self.errors = []
+
+    def check_all(self):
+        """
+        Run all checks on the input file and return the errors.
+        """
+        Checker.check_all(self)
+        return self.errors
+
+    def report_error(self, line_number, offset, text, check):
+        """
+        Collect an error, to be reported later in the parent process.
+        """
+        self.errors.append((line_number, offset, text, check.__name__))
+
+
+def input_file(filename, collected=None):
+    """
+    Run all checks on a Python source file. If collected is given, the
+    checks have already run in a worker process (see collect_errors) and
+    only the results are reported here.
     """
     if excluded(filename) or not filename_match(filename):
         return {}
     if options.verbose:
         message('checking ' + filename)
-    options.counters['files'] = options.counters.get('files', 0) + 1
-    errors = Checker(filename).check_all()
+    options.counters['files'] += 1
+    if collected is None:
+        errors = Checker(filename).check_all()
+    else:
+        lines, found, counters, failure, trace = collected
+        options.counters.update(counters)
+        errors = Checker(filename, lines).report_collected(found)
+        if failure is not None:
+            sys.stderr.write('Error in worker process:\n' + trace)
+            raise failure
     if options.testsuite and not errors:
         message("%s: %s" % (filename, "no errors found"))
 
@@ -691,29 +785,88 @@ def input_dir(dirname):
     dirname = dirname.rstrip('/')
     if excluded(dirname):
         return
+    directories = [] # Pairs of root and filenames for input_parallel
     for root, dirs, files in os.walk(dirname):
-        if options.verbose:
-            message('directory ' + root)
-        options.counters['directories'] = \
-            options.counters.get('directories', 0) + 1
+        options.counters['directories'] += 1
         dirs.sort()
-        for subdir in dirs:
-            if excluded(subdir):
-                dirs.remove(subdir)
+        dirs[:] = [subdir for subdir in dirs if not excluded(subdir)]
         files.sort()
-        for filename in files:
-            input_file(os.path.join(root, filename))
+        filenames = [os.path.join(root, filename) for filename in files]
+        if options.jobs > 1:
+            directories.append((root, filenames))
+            continue
+        if options.verbose:
+            message('directory ' + root)
+        for filename in filenames:
+            input_file(filename)
+    if directories:
+        input_parallel(directories)
+
+
+def input_parallel(directories):
+    """
+    Run all checks on the files in a pool of worker processes. The errors
+    are reported here, in the original order of the files. The verbose
+    directory messages are also printed here, just before the files in
+    that directory, so that the output is the same as in a serial run.
+    """
+    import multiprocessing
+    checked = []
+    for root, filenames in directories:
+        filenames[:] = [filename for filename in filenames
+                        if not excluded(filename) and filename_match(filename)]
+        checked.extend(filenames)
+    pool = multiprocessing.Pool(options.jobs, init_worker, (options, ))
+    try:
+        results = pool.imap(collect_errors, checked)
+        for root, filenames in directories:
+            if options.verbose:
+                message('directory ' + root)
+            for filename in filenames:
+                result = results.next()
+                input_file(result[0], result[1:])
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def init_worker(parent_options):
+    """
+    Set up a worker process. The options are not inherited on platforms
+    without fork, so they are passed in from the parent process.
+    """
+    global options
+    options = parent_options
+
+
+def collect_errors(filename):
+    """
+    Run all checks on a Python source file in a worker process. Return
+    the collected errors and the counters for this file, the raw lines
+    if they are needed for --show-source, and the exception and its
+    formatted traceback if the checks failed, so that the errors found
+    before it are still reported.
+    """
+    options.counters = Counter()
+    lines = errors = []
+    failure = trace = None
+    try:
+        checker = CollectingChecker(filename)
+        errors = checker.errors
+        if options.show_source:
+            lines = checker.lines
+        checker.check_all()
+    except Exception, failure:
+        trace = traceback.format_exc()
+    return filename, lines, errors, options.counters, failure, trace
 
 
 def excluded(filename):
     """
     Check if options.exclude contains a pattern that matches filename.
     """
-    basename = os.path.basename(filename)
-    for pattern in options.exclude:
-        if fnmatch(basename, pattern):
-            # print basename, 'excluded because it matches', pattern
-            return True
+    basename = os.path.normcase(os.path.basename(filename))
+    return options.exclude_regex.match(basename) is not None
 
 
 def filename_match(filename):
@@ -732,9 +885,8 @@ def ignore_code(code):
     """
     Check if options.ignore contains a prefix of the error code.
     """
-    for ignore in options.ignore:
-        if code.startswith(ignore):
-            return True
+    return (options.ignore_regex is not None and
+            options.ignore_regex.match(code) is not None)
 
 
 def get_error_statistics():
@@ -803,6 +955,8 @@ def process_options(arglist=None):
                       help="only check matching files (e.g. *.py)")
     parser.add_option('--ignore', metavar='errors', default='',
                       help="skip errors and warnings (e.g. E4,W)")
+    parser.add_option('--jobs', metavar='n', type='int', default=1,
+                      help="check files in n parallel processes")
     parser.add_option('--repeat', action='store_true',
                       help="show all occurrences of the same error")
     parser.add_option('--show-source', action='store_true',
@@ -826,13 +980,22 @@ def process_options(arglist=None):
     options.exclude = options.exclude.split(',')
     for index in range(len(options.exclude)):
         options.exclude[index] = options.exclude[index].rstrip('/')
+    # All patterns in one regex, with the same semantics as fnmatch.
+    options.exclude_regex = re.compile('|'.join(
+        ['(?:%s)' % translate(os.path.normcase(pattern))
+         for pattern in options.exclude]))
     if options.filename:
         options.filename = options.filename.split(',')
     if options.ignore:
         options.ignore = options.ignore.split(',')
+        options.ignore_regex = re.compile('|'.join(
+            [re.escape(prefix) for prefix in options.ignore]))
     else:
         options.ignore = []
-    options.counters = {}
+        options.ignore_regex = None
+    if options.verbose >= 2:
+        options.jobs = 1 # Keep the per-line output of check_logical in order
+    options.counters = Counter()
     options.messages = {}
 
     return options, args
@@ -859,5 +1022,27 @@ def _main():
         print_benchmark(elapsed)
 
 
+# All check functions are defined by now, so look them up only once.
+physical_checks = find_checks('physical_line')
+logical_checks = find_checks('logical_line')
+
+# These checks can't find anything on logical lines without a match for
+# whitespace_suspect_search, so check_logical skips them there.
+whitespace_checks = ('extraneous_whitespace', 'whitespace_around_comma',
+                     'whitespace_around_operator')
+clean_logical_checks = [(name, check, caller)
+                        for name, check, caller in logical_checks
+                        if name not in whitespace_checks]
+
+# These checks can't find anything on physical lines that pass the quick
+# test at the start of check_physical, so they are skipped there.
+layout_checks = ('maximum_line_length', 'missing_newline', 'tabs_obsolete',
+                 'tabs_or_spaces', 'trailing_blank_lines',
+                 'trailing_whitespace')
+clean_physical_checks = [(name, check, caller)
+                         for name, check, caller in physical_checks
+                         if name not in layout_checks]
+
+
 if __name__ == '__main__':
     _main()
@@ -0,0 +1,6 @@
+options = {
+    'py2exe': {
+        'dist_dir': 'bin',
+        }
+    }
+print options , 2
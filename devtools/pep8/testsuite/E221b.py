@@ -0,0 +1,3 @@
+color  = 1
+this  = 3
+hand  = 4
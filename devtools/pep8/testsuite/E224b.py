@@ -0,0 +1,2 @@
+a >>=	1
+b = a or	c